@@ -1,15 +1,25 @@
 import streamlit as st
-from streamlit_option_menu import option_menu # For a nicer sidebar menu
 import firebase_admin
 from firebase_admin import credentials, firestore, auth as firebase_auth
 from google.cloud.firestore_v1.base_query import FieldFilter
+from google.cloud.firestore_v1.services.firestore import FirestoreClient as FirestoreApiClient
 import requests
+from requests.adapters import HTTPAdapter
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
 import datetime
+import copy
+import json
 import os
 from dotenv import load_dotenv
 from fpdf import FPDF
 import time
+import hashlib
+from email.utils import parsedate_to_datetime
 import uuid # For generating unique user IDs if needed
+from functools import partial
+import concurrent.futures
+import threading
+from collections import OrderedDict
 
 # Load environment variables from .env file for local development
 load_dotenv()
@@ -17,10 +27,18 @@ load_dotenv()
 # --- Configuration ---
 APP_ID = os.getenv("APP_ID", "default-ai-content-tool-v2")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MAX_RPM = int(os.getenv("GEMINI_MAX_RPM", "60")) # Requests per minute allowed for the shared API key
+GEMINI_TIMEOUT = (10, 120) # (connect, read) seconds
+GEMINI_MAX_RETRY_AFTER = 8 # Longest Retry-After (seconds) we will sleep for; longer requests fail fast
+
+# Must be the first Streamlit call so Firebase init errors render with the page config applied
+st.set_page_config(layout="wide", page_title="Conteúdo IA")
 
 # --- Firebase Initialization ---
 # Ensure GOOGLE_APPLICATION_CREDENTIALS is set in your environment or .env file
-try:
+@st.cache_resource
+def get_firestore_client():
+    # Runs once per server process; the client is shared across reruns and sessions
     if not firebase_admin._apps:
         cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         if not cred_path:
@@ -32,20 +50,34 @@ try:
         
         cred = credentials.Certificate(cred_path)
         firebase_admin.initialize_app(cred)
-    db = firestore.client()
+    client = firestore.client()
+    # The Admin SDK always builds a gRPC channel; swap in the REST transport to cut cold-start latency.
+    # Left alone under FIRESTORE_EMULATOR_HOST so the SDK keeps routing to the emulator.
+    if not client._emulator_host:
+        client._firestore_api_internal = FirestoreApiClient(
+            transport="rest",
+            credentials=client._credentials,
+            client_options=client._client_options,
+            client_info=client._client_info,
+        )
+    return client
+
+try:
+    db = get_firestore_client()
 except Exception as e:
     st.error(f"Error initializing Firebase: {e}")
     # Mock db for UI development if Firebase fails (optional)
     class MockDB:
         def collection(self, name): return self
         def document(self, id=None): return self
-        def get(self): return MockDocSnapshot()
+        def get(self, field_paths=None): return MockDocSnapshot()
         def stream(self): return []
         def add(self, data): return None, MockDocRef()
         def update(self, data): return None
         def delete(self): return None
         def order_by(self, field, direction): return self
         def limit(self, num): return self
+        def select(self, field_paths): return self
         def start_after(self, doc_snapshot): return self
         def where(self, field_path=None, op_string=None, value=None, filter=None): return self
 
@@ -71,7 +103,24 @@ tool_configs = {
   'summary': { 'id': 'summary', 'name': "Resumidor de Conteúdos", 'description': "Resuma textos longos de forma rápida e eficiente.", 'promptPlaceholder': "Cole aqui o texto que você deseja resumir...", 'icon': '✍️', 'apiPromptPrefix': "Faça um resumo conciso e informativo do seguinte texto: ", 'sampleOutput': "Resumo do texto Z...", },
 }
 popular_tools_ids = ['article', 'headline', 'social', 'summary']
+# Lookups derived once from tool_configs instead of on every rerun
+TOOL_ICONS = {k: v['icon'] for k, v in tool_configs.items()}
 ITEMS_PER_PAGE = 5
+CONTENT_LIST_FIELDS = ['toolId', 'toolName', 'prompt', 'createdAt']
+
+# Session state defaults, applied on every rerun
+_DEFAULT_SESSION_STATE = {
+    "is_loading": False,
+    "generated_result": "",
+    "error_message": "",
+    "user_id": None, # Will be set by get_user_id()
+    "user_display_name": "Usuário",
+    "generated_content_list": [],
+    "last_doc_snapshot": None,
+    "has_more_content": True,
+    "is_loading_content": True, # Start loading content on first run of "My Content"
+    "next_page_future": None, # Prefetched next page of "My Content"
+}
 
 # --- Helper Functions ---
 def add_toast(message, type='info'):
@@ -99,9 +148,16 @@ def get_user_id():
     return st.session_state.user_id
 
 def get_user_display_name():
-    get_user_id() # ensure user_id and display_name are initialized
-    return st.session_state.user_display_name
+    # Memoized per session: user_id and display_name only need initializing once
+    if '_display_name_cached' not in st.session_state:
+        get_user_id() # ensure user_id and display_name are initialized
+        st.session_state._display_name_cached = st.session_state.user_display_name
+    return st.session_state._display_name_cached
+
 
+def _content_key(text):
+    # Stable per-content widget key suffix, so download buttons survive reruns
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
 
 def download_as_txt(text, filename='conteudo.txt'):
     return st.download_button(
@@ -109,31 +165,36 @@ def download_as_txt(text, filename='conteudo.txt'):
         data=text,
         file_name=filename,
         mime='text/plain',
-        key=f"txt_dl_{filename}_{time.time()}" # Unique key
+        key=f"txt_dl_{filename}_{_content_key(text)}" # Unique key
     )
 
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def _build_pdf(text):
+    # Rendered once per unique text; reruns reuse the cached bytes
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12) # Basic font, FPDF has limited Unicode support by default
+                               # For full Unicode, you might need to add a specific font like DejaVu
+    
+    # Attempt to encode to latin-1, replacing unsupported characters
+    # This is a common workaround for basic FPDF. For better results, consider reportlab or ensure font supports chars.
+    # ASCII text is already Latin-1 safe; isascii() is a flag check, so the round-trip copy is skipped
+    text_encoded = text if text.isascii() else text.encode('latin-1', 'replace').decode('latin-1')
+    
+    pdf.multi_cell(0, 10, text_encoded) # multi_cell already breaks on embedded newlines
+    
+    return bytes(pdf.output()) # fpdf2 returns a bytearray
+
 def download_as_pdf(text, filename='conteudo.pdf'):
     try:
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", size=12) # Basic font, FPDF has limited Unicode support by default
-                                   # For full Unicode, you might need to add a specific font like DejaVu
-        
-        # Attempt to encode to latin-1, replacing unsupported characters
-        # This is a common workaround for basic FPDF. For better results, consider reportlab or ensure font supports chars.
-        text_encoded = text.encode('latin-1', 'replace').decode('latin-1')
-        
-        for line in text_encoded.split('\n'):
-            pdf.multi_cell(0, 10, line)
-        
-        pdf_output = pdf.output(dest='S').encode('latin-1') # Get as bytes
+        pdf_output = _build_pdf(text)
         
         st.download_button(
             label="📥 Baixar .pdf",
             data=pdf_output,
             file_name=filename,
             mime='application/pdf',
-            key=f"pdf_dl_{filename}_{time.time()}" # Unique key
+            key=f"pdf_dl_{filename}_{_content_key(text)}" # Unique key
         )
         add_toast('PDF pronto para download!', 'success')
     except Exception as e:
@@ -141,10 +202,199 @@ def download_as_pdf(text, filename='conteudo.pdf'):
         add_toast('Erro ao gerar PDF.', 'error')
 
 
+# --- Gemini API ---
+class GeminiResponseError(Exception):
+    """Raised when the Gemini API answers without usable content."""
+
+class GeminiRateLimiter:
+    # Token bucket shared by every session, since they all spend the same API key.
+    # The refill rate halves on each 429 and recovers additively on success (AIMD);
+    # a 429 also drains the bucket so the slower rate applies immediately.
+    def __init__(self, max_rpm):
+        self.capacity = float(max_rpm)
+        self.max_rate = max_rpm / 60.0 # tokens per second
+        self.rate = self.max_rate
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # Reserves one request and returns how long to wait before sending it
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def on_throttled(self, retry_after=None):
+        with self.lock:
+            self.rate = max(self.rate / 2, self.max_rate / 16)
+            # Drain the bucket; with Retry-After, go into debt so every session waits that long (capped)
+            self.tokens = min(self.tokens, -min(retry_after or 0, GEMINI_MAX_RETRY_AFTER) * self.rate)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.rate + self.max_rate / 10, self.max_rate)
+
+@st.cache_resource
+def get_http_session():
+    # Shared keep-alive pool so repeated generations skip the TCP+TLS handshake; retries are handled by tenacity
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+    return session
+
+@st.cache_resource
+def get_gemini_rate_limiter():
+    return GeminiRateLimiter(GEMINI_MAX_RPM)
+
+class GeminiResponseCache:
+    # Bounded (tool_id, prompt) -> text cache shared by every session.
+    # Streamed output can't go through st.cache_data, so finished responses are stored here.
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict() # key -> (stored_at, text), least recently used first
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            stored_at, text = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self.lock:
+            self.entries[key] = (time.monotonic(), text)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+@st.cache_resource
+def get_gemini_response_cache():
+    return GeminiResponseCache(ttl=3600, max_entries=256)
+
+def _retry_after_seconds(response):
+    # Retry-After may be delta-seconds or an HTTP date
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (retry_at - datetime.datetime.now(tz=datetime.timezone.utc)).total_seconds())
+
+_gemini_backoff = wait_exponential(multiplier=1, min=1, max=8)
+
+def _gemini_retry_wait(retry_state):
+    # Exponential backoff, but never shorter than the server's Retry-After
+    wait = _gemini_backoff(retry_state)
+    exc = retry_state.outcome.exception()
+    if isinstance(exc, requests.exceptions.HTTPError):
+        retry_after = _retry_after_seconds(exc.response)
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, GEMINI_MAX_RETRY_AFTER))
+    return wait
+
+def _is_retryable_gemini_error(exc):
+    if isinstance(exc, requests.exceptions.HTTPError):
+        if exc.response is None or not (exc.response.status_code == 429 or exc.response.status_code >= 500):
+            return False
+        # A server asking us to wait longer than we're willing to sleep is reported straight away
+        retry_after = _retry_after_seconds(exc.response)
+        return retry_after is None or retry_after <= GEMINI_MAX_RETRY_AFTER
+    return isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError))
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=_gemini_retry_wait,
+    retry=retry_if_exception(_is_retryable_gemini_error),
+    reraise=True, # Surface the original requests error once retries are exhausted
+)
+def _open_gemini_stream(api_url, payload):
+    limiter = get_gemini_rate_limiter()
+    delay = limiter.acquire()
+    if delay:
+        time.sleep(delay)
+    response = get_http_session().post(api_url, json=payload, headers={'Content-Type': 'application/json'}, stream=True, timeout=GEMINI_TIMEOUT)
+    if response.status_code == 429:
+        limiter.on_throttled(_retry_after_seconds(response))
+    try:
+        response.raise_for_status() # Raise an exception for bad status codes
+    except requests.exceptions.HTTPError:
+        response.close()
+        raise
+    limiter.on_success()
+    return response
+
+def _stream_gemini(tool_id, prompt):
+    # Yields text chunks as Gemini produces them (server-sent events)
+    full_prompt = f"{tool_configs[tool_id]['apiPromptPrefix']}{prompt}"
+    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}" # Updated model
+    payload = {"contents": [{"parts": [{"text": full_prompt}]}]}
+
+    result = {}
+    has_text = False
+    with _open_gemini_stream(api_url, payload) as response:
+        for raw_line in response.iter_lines():
+            line = raw_line.decode('utf-8') # SSE responses don't declare a charset
+            if not line.startswith("data:"):
+                continue
+            result = json.loads(line[len("data:"):])
+            candidates = result.get("candidates")
+            parts = candidates[0].get("content", {}).get("parts") if candidates else None
+            if not parts:
+                continue
+            # Chunks almost always carry a single part; skip the join for that case
+            text = parts[0].get("text", "") if len(parts) == 1 else "".join(part.get("text", "") for part in parts)
+            if text:
+                has_text = True
+                yield text
+
+    if not has_text:
+        finish_reason = result.get("candidates", [{}])[0].get("finishReason", "N/A")
+        safety_ratings = result.get("candidates", [{}])[0].get("safetyRatings", [])
+        print("Estrutura de resposta inesperada:", result)
+        raise GeminiResponseError(f"Resposta da API vazia ou malformada. Motivo: {finish_reason}. Classificações: {safety_ratings}")
+
+
 # --- Firestore Interaction Functions ---
-def get_content_collection_ref():
-    user_id = get_user_id()
-    return db.collection(f"artifacts/{APP_ID}/users/{user_id}/generated_content")
+def _fmt_ts(created_at_obj):
+    # Display string for a createdAt value
+    if created_at_obj:
+        if isinstance(created_at_obj, datetime.datetime):
+            # If it's already a Python datetime (e.g., after Firestore conversion)
+            dt_object = created_at_obj
+        elif hasattr(created_at_obj, 'seconds'): # Firestore Timestamp
+            dt_object = datetime.datetime.fromtimestamp(created_at_obj.seconds, tz=datetime.timezone.utc).astimezone()
+        else: # Fallback for unexpected type
+            dt_object = None
+
+        if dt_object:
+            return dt_object.strftime('%d/%m/%Y %H:%M')
+    return "Data antiga"
+
+@st.cache_resource
+def _collection_ref(user_id, db_kind, _db):
+    # One CollectionReference per user and client kind; the leading underscore keeps the
+    # unhashable client out of the key, so db_kind stops a MockDB ref outliving a real client
+    return _db.collection(f"artifacts/{APP_ID}/users/{user_id}/generated_content")
+
+def get_content_collection_ref(user_id=None):
+    return _collection_ref(user_id or get_user_id(), type(db).__name__, db)
 
 def save_content_to_firestore(content_data):
     user_id = get_user_id()
@@ -154,45 +404,89 @@ def save_content_to_firestore(content_data):
     try:
         content_data["createdAt"] = firestore.SERVER_TIMESTAMP
         content_collection = get_content_collection_ref()
-        content_collection.add(content_data)
+        _, doc_ref = content_collection.add(content_data)
         add_toast("Conteúdo salvo com sucesso!", "success")
-        # Trigger rerun or update local list if needed
-        if 'generated_content_list' in st.session_state: # Invalidate cache
-            del st.session_state['generated_content_list']
+        # Prepend to the loaded list instead of refetching it; if it isn't loaded yet the initial fetch picks it up
+        if not st.session_state.get('is_loading_content', True):
+            created_at = datetime.datetime.now(tz=datetime.timezone.utc)
+            local_item = {**content_data, 'id': doc_ref.id, 'createdAt': created_at, '_created_display': _fmt_ts(created_at)}
+            st.session_state.generated_content_list.insert(0, local_item)
         st.rerun()
 
     except Exception as e:
         print(f"Erro ao salvar conteúdo no Firestore: {e}")
         add_toast(f"Falha ao salvar conteúdo: {e}", "error")
 
+def query_content_page(content_collection, limit_num=ITEMS_PER_PAGE, last_doc_snapshot=None):
+    # No Streamlit calls here so it can also run on the prefetch pool
+    # Project only the list metadata; the (potentially large) text is fetched on demand
+    query = content_collection.order_by("createdAt", direction=firestore.Query.DESCENDING).select(CONTENT_LIST_FIELDS).limit(limit_num)
+    if last_doc_snapshot:
+        query = query.start_after(last_doc_snapshot)
+    
+    docs_snapshots = list(query.stream())
+    content = []
+    for doc_snap in docs_snapshots:
+        item = doc_snap.to_dict()
+        item['id'] = doc_snap.id
+        item['_created_display'] = _fmt_ts(item.get('createdAt')) # Formatted once here, not on every render
+        content.append(item)
+    
+    new_last_doc = docs_snapshots[-1] if docs_snapshots else None
+    has_more = len(docs_snapshots) == limit_num
+    return content, new_last_doc, has_more
+
 def fetch_content(limit_num=ITEMS_PER_PAGE, last_doc_snapshot=None):
     user_id = get_user_id()
     if not user_id:
         return [], None, False
     
-    content_collection = get_content_collection_ref()
-    query = content_collection.order_by("createdAt", direction=firestore.Query.DESCENDING).limit(limit_num)
-    if last_doc_snapshot:
-        query = query.start_after(last_doc_snapshot)
-    
     try:
-        docs_snapshots = list(query.stream())
-        content = []
-        for doc_snap in docs_snapshots:
-            item = doc_snap.to_dict()
-            item['id'] = doc_snap.id
-            if 'createdAt' in item and hasattr(item['createdAt'], 'isoformat'): # Check if it's a datetime object
-                 # Convert to user's local timezone if needed, or keep as UTC. For simplicity, use as is.
-                pass # Firestore timestamps are timezone-aware (UTC)
-            content.append(item)
-        
-        new_last_doc = docs_snapshots[-1] if docs_snapshots else None
-        has_more = len(docs_snapshots) == limit_num
-        return content, new_last_doc, has_more
+        return query_content_page(get_content_collection_ref(), limit_num, last_doc_snapshot)
+    except Exception as e:
+        st.error(f"Erro ao buscar conteúdos: {e}")
+        return [], None, False
+
+@st.cache_resource
+def get_pool():
+    return concurrent.futures.ThreadPoolExecutor(max_workers=2)
+
+def prefetch_next_content_page():
+    # Start loading the page after the current cursor while the user reads the list
+    if st.session_state.get('next_page_future') is None:
+        st.session_state.next_page_future = get_pool().submit(
+            query_content_page,
+            get_content_collection_ref(),
+            ITEMS_PER_PAGE,
+            st.session_state.last_doc_snapshot
+        )
+
+def fetch_next_content_page():
+    future = st.session_state.get('next_page_future')
+    st.session_state.next_page_future = None
+    if future is None:
+        return fetch_content(ITEMS_PER_PAGE, st.session_state.last_doc_snapshot)
+    try:
+        return future.result()
     except Exception as e:
         st.error(f"Erro ao buscar conteúdos: {e}")
         return [], None, False
 
+@st.cache_data(ttl=300, max_entries=256, show_spinner=False)
+def fetch_content_text(user_id, doc_id):
+    doc_snap = get_content_collection_ref(user_id).document(doc_id).get(field_paths=['text'])
+    return (doc_snap.to_dict() or {}).get('text', '')
+
+def get_content_text(item):
+    # Items saved/edited in this session already carry their text; returns None if the read fails
+    if 'text' not in item:
+        try:
+            item['text'] = fetch_content_text(get_user_id(), item['id'])
+        except Exception as e:
+            st.error(f"Erro ao buscar conteúdo: {e}")
+            return None # Nothing stored, so the next run retries
+    return item['text']
+
 
 def delete_content_from_firestore(content_id):
     user_id = get_user_id()
@@ -203,8 +497,12 @@ def delete_content_from_firestore(content_id):
         doc_ref = get_content_collection_ref().document(content_id)
         doc_ref.delete()
         add_toast("Conteúdo excluído com sucesso!", "success")
-        if 'generated_content_list' in st.session_state: # Invalidate cache
-            del st.session_state['generated_content_list']
+        # Drop the item locally instead of refetching the list
+        st.session_state.generated_content_list = [
+            x for x in st.session_state.get('generated_content_list', []) if x['id'] != content_id
+        ]
+        if not st.session_state.generated_content_list and st.session_state.get('has_more_content', False):
+            st.session_state.is_loading_content = True # Every loaded item is gone; rerun the initial fetch
         st.rerun()
 
     except Exception as e:
@@ -220,9 +518,13 @@ def update_content_in_firestore(content_id, updated_data):
         updated_data["updatedAt"] = firestore.SERVER_TIMESTAMP
         doc_ref = get_content_collection_ref().document(content_id)
         doc_ref.update(updated_data)
+        fetch_content_text.clear(user_id, content_id)
         add_toast("Conteúdo atualizado com sucesso!", "success")
-        if 'generated_content_list' in st.session_state: # Invalidate cache
-            del st.session_state['generated_content_list']
+        # Patch the item locally instead of refetching the list
+        for item in st.session_state.get('generated_content_list', []):
+            if item['id'] == content_id:
+                item.update({k: v for k, v in updated_data.items() if k != "updatedAt"})
+                break
         return True
     except Exception as e:
         print(f"Erro ao atualizar conteúdo: {e}")
@@ -246,8 +548,7 @@ def render_dashboard_page():
                 st.subheader(f"{tool['icon']} {tool['name']}")
                 st.caption(tool['description'])
                 if st.button(f"Acessar {tool['name']}", key=f"dash_btn_{tool_id}", use_container_width=True):
-                    st.session_state.current_page = f"tool/{tool_id}"
-                    st.rerun()
+                    st.switch_page(tool_pages[tool_id])
         col_idx += 1
 
 def render_tool_page(tool_key):
@@ -285,26 +586,21 @@ def render_tool_page(tool_key):
 
     if st.session_state.get('is_loading', False):
         with st.spinner("Gerando conteúdo... Por favor, aguarde."):
-            full_prompt = f"{tool['apiPromptPrefix']}{st.session_state[f'prompt_{tool_key}']}" # Use the stored prompt
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={GEMINI_API_KEY}" # Updated model
-            payload = {"contents": [{"parts": [{"text": full_prompt}]}]}
-            
             try:
-                response = requests.post(api_url, json=payload, headers={'Content-Type': 'application/json'})
-                response.raise_for_status() # Raise an exception for bad status codes
-                result = response.json()
-
-                if result.get("candidates") and result["candidates"][0].get("content", {}).get("parts"):
-                    text_parts = [part.get("text", "") for part in result["candidates"][0]["content"]["parts"]]
-                    st.session_state.generated_result = "".join(text_parts)
-                    add_toast('Conteúdo gerado com sucesso!', 'success')
+                prompt_used = st.session_state[f'prompt_{tool_key}'] # Use the stored prompt
+                response_cache = get_gemini_response_cache()
+                cached_result = response_cache.get((tool_key, prompt_used))
+                if cached_result is not None:
+                    st.session_state.generated_result = cached_result
                 else:
-                    finish_reason = result.get("candidates", [{}])[0].get("finishReason", "N/A")
-                    safety_ratings = result.get("candidates", [{}])[0].get("safetyRatings", [])
-                    detailed_error = f"Resposta da API vazia ou malformada. Motivo: {finish_reason}. Classificações: {safety_ratings}"
-                    print("Estrutura de resposta inesperada:", result)
-                    st.session_state.generated_result = f"Não foi possível gerar o conteúdo. {detailed_error}"
-                    add_toast(f"Falha ao gerar: {detailed_error}", 'error')
+                    result = st.write_stream(_stream_gemini(tool_key, prompt_used))
+                    st.session_state.generated_result = result
+                    if result: # Only complete streams reach here; failures raise and are never cached
+                        response_cache.put((tool_key, prompt_used), result)
+                add_toast('Conteúdo gerado com sucesso!', 'success')
+            except GeminiResponseError as e:
+                st.session_state.generated_result = f"Não foi possível gerar o conteúdo. {e}"
+                add_toast(f"Falha ao gerar: {e}", 'error')
             except requests.exceptions.RequestException as e:
                 st.session_state.error_message = f"Erro de rede/API: {e}"
                 st.session_state.generated_result = tool.get('sampleOutput', "Ocorreu um erro ao gerar o conteúdo.")
@@ -347,6 +643,35 @@ def render_tool_page(tool_key):
 
 
 def render_my_content_page():
+    # Dialogs open on the run that calls them; widget interactions inside only rerun the dialog,
+    # and a full rerun is triggered only to close them after Save/Cancel
+    @st.dialog("Editar Conteúdo")
+    def edit_modal(item_id, tool_name, prompt, text):
+        st.caption(tool_name)
+        current_prompt = st.text_area("Prompt Original:", value=prompt, height=100, key=f"edit_prompt_{item_id}")
+        current_text = st.text_area("Conteúdo Gerado:", value=text, height=200, key=f"edit_text_{item_id}")
+        
+        save_col, cancel_col = st.columns(2)
+        if save_col.button("Salvar Alterações", key=f"save_edit_{item_id}", use_container_width=True):
+            if not current_text.strip():
+                add_toast("O conteúdo não pode estar vazio.", "error")
+            else:
+                success = update_content_in_firestore(item_id, {'prompt': current_prompt, 'text': current_text})
+                if success:
+                    st.rerun() # Close dialog on success
+        if cancel_col.button("Cancelar", key=f"cancel_edit_{item_id}", use_container_width=True):
+            st.rerun()
+
+    @st.dialog("Confirmar Exclusão")
+    def confirm_delete_modal(item_id):
+        st.warning("Tem certeza de que deseja excluir este item? Esta ação não pode ser desfeita.")
+        confirm_col, cancel_col = st.columns(2)
+        if confirm_col.button("Sim, Excluir", type="primary", key=f"confirm_del_btn_{item_id}", use_container_width=True):
+            delete_content_from_firestore(item_id) # Reruns (closing the dialog) on success
+            st.rerun()
+        if cancel_col.button("Cancelar", key=f"cancel_del_btn_{item_id}", use_container_width=True):
+            st.rerun()
+
     st.title("💾 Meus Conteúdos Salvos")
 
     # Initialize session state for content list, last doc, and has_more
@@ -355,6 +680,7 @@ def render_my_content_page():
         st.session_state.last_doc_snapshot = None
         st.session_state.has_more_content = True
         st.session_state.is_loading_content = True # Trigger initial load
+        st.session_state.next_page_future = None
     
     if st.session_state.get('is_loading_content', True) and not st.session_state.generated_content_list:
         with st.spinner("Carregando seus conteúdos..."):
@@ -363,6 +689,7 @@ def render_my_content_page():
             st.session_state.last_doc_snapshot = last_doc
             st.session_state.has_more_content = has_more
             st.session_state.is_loading_content = False
+            st.session_state.next_page_future = None
             st.rerun()
 
 
@@ -372,100 +699,38 @@ def render_my_content_page():
 
     for i, item in enumerate(st.session_state.generated_content_list):
         tool_name = item.get('toolName', 'Desconhecido')
-        tool_icon = tool_configs.get(item.get('toolId', ''), {}).get('icon', '📝')
+        tool_icon = TOOL_ICONS.get(item.get('toolId', ''), '📝')
         
-        # Format createdAt timestamp
-        created_at_display = "Data antiga"
-        created_at_obj = item.get('createdAt')
-        if created_at_obj:
-            if isinstance(created_at_obj, datetime.datetime):
-                # If it's already a Python datetime (e.g., after Firestore conversion)
-                dt_object = created_at_obj
-            elif hasattr(created_at_obj, 'seconds'): # Firestore Timestamp
-                 dt_object = datetime.datetime.fromtimestamp(created_at_obj.seconds, tz=datetime.timezone.utc).astimezone()
-            else: # Fallback for unexpected type
-                dt_object = None
-
-            if dt_object:
-                 created_at_display = dt_object.strftime('%d/%m/%Y %H:%M')
-
-
-        with st.expander(f"{tool_icon} {tool_name} - {created_at_display}", expanded=False):
+        with st.expander(f"{tool_icon} {tool_name} - {item['_created_display']}", expanded=False):
             st.caption(f"Prompt: \"{item.get('prompt', 'N/A')}\"")
-            st.markdown(f"```text\n{item.get('text', '')}\n```")
+            # Expander bodies always execute, so the text is only fetched once the user asks for it
+            item_text = None
+            if st.toggle("Mostrar conteúdo", key=f"show_text_{item['id']}"):
+                item_text = get_content_text(item)
+            if item_text is not None:
+                st.markdown(f"```text\n{item_text}\n```")
             
             c1, c2, c3, c4 = st.columns([2,2,1,1])
-            with c1:
-                download_as_txt(item.get('text', ''), f"{tool_name.replace(' ', '_')}_{item['id']}.txt")
-            with c2:
-                download_as_pdf(item.get('text', ''), f"{tool_name.replace(' ', '_')}_{item['id']}.pdf")
+            if item_text is not None:
+                with c1:
+                    download_as_txt(item_text, f"{tool_name.replace(' ', '_')}_{item['id']}.txt")
+                with c2:
+                    download_as_pdf(item_text, f"{tool_name.replace(' ', '_')}_{item['id']}.pdf")
             with c3:
                 if st.button("✏️ Editar", key=f"edit_{item['id']}", use_container_width=True):
-                    st.session_state.editing_item_id = item['id']
-                    st.session_state.editing_item_prompt = item.get('prompt', '')
-                    st.session_state.editing_item_text = item.get('text', '')
-                    st.session_state.editing_item_toolName = tool_name
-                    # No direct modal, we will render the edit form below or use st.dialog
-                    # For now, let's just set state and you'd handle dialog display logic
-                    st.rerun() # Will show the dialog if conditions met
+                    edit_text = get_content_text(item)
+                    if edit_text is not None:
+                        edit_modal(item['id'], tool_name, item.get('prompt', ''), edit_text)
             with c4:
                 if st.button("🗑️ Excluir", key=f"delete_{item['id']}", use_container_width=True):
-                    st.session_state.deleting_item_id = item['id']
-                    # st.rerun() # Will show the dialog if conditions met
-
-    # Edit Dialog Logic (using st.dialog)
-    if 'editing_item_id' in st.session_state and st.session_state.editing_item_id:
-        item_id = st.session_state.editing_item_id
-        
-        @st.dialog(f"Editar Conteúdo: {st.session_state.editing_item_toolName}")
-        def edit_modal():
-            current_prompt = st.text_area("Prompt Original:", value=st.session_state.editing_item_prompt, height=100, key=f"edit_prompt_{item_id}")
-            current_text = st.text_area("Conteúdo Gerado:", value=st.session_state.editing_item_text, height=200, key=f"edit_text_{item_id}")
-            
-            save_col, cancel_col = st.columns(2)
-            if save_col.button("Salvar Alterações", key=f"save_edit_{item_id}", use_container_width=True):
-                if not current_text.strip():
-                    add_toast("O conteúdo não pode estar vazio.", "error")
-                else:
-                    success = update_content_in_firestore(item_id, {'prompt': current_prompt, 'text': current_text})
-                    if success:
-                        del st.session_state.editing_item_id # Close dialog on success
-                        st.rerun()
-            if cancel_col.button("Cancelar", key=f"cancel_edit_{item_id}", use_container_width=True):
-                del st.session_state.editing_item_id
-                st.rerun()
-        
-        # Call the dialog function to display it
-        edit_modal()
-
-
-    # Delete Confirmation Dialog Logic (using st.dialog)
-    if 'deleting_item_id' in st.session_state and st.session_state.deleting_item_id:
-        item_id_to_delete = st.session_state.deleting_item_id
-
-        @st.dialog("Confirmar Exclusão")
-        def confirm_delete_modal():
-            st.warning("Tem certeza de que deseja excluir este item? Esta ação não pode ser desfeita.")
-            confirm_col, cancel_col = st.columns(2)
-            if confirm_col.button("Sim, Excluir", type="primary", key=f"confirm_del_btn_{item_id_to_delete}", use_container_width=True):
-                delete_content_from_firestore(item_id_to_delete)
-                del st.session_state.deleting_item_id # Close dialog
-                st.rerun()
-            if cancel_col.button("Cancelar", key=f"cancel_del_btn_{item_id_to_delete}", use_container_width=True):
-                del st.session_state.deleting_item_id # Close dialog
-                st.rerun()
-        
-        confirm_delete_modal()
-
+                    confirm_delete_modal(item['id'])
 
     if st.session_state.get('has_more_content', False) and not st.session_state.get('is_loading_content', False):
+        prefetch_next_content_page()
         if st.button("Carregar Mais Conteúdos", key="load_more_my_content", use_container_width=True):
             st.session_state.is_loading_content = True
             with st.spinner("Carregando mais..."):
-                new_content, new_last_doc, new_has_more = fetch_content(
-                    ITEMS_PER_PAGE, 
-                    st.session_state.last_doc_snapshot
-                )
+                new_content, new_last_doc, new_has_more = fetch_next_content_page()
                 st.session_state.generated_content_list.extend(new_content)
                 st.session_state.last_doc_snapshot = new_last_doc if new_last_doc else st.session_state.last_doc_snapshot
                 st.session_state.has_more_content = new_has_more
@@ -476,27 +741,9 @@ def render_my_content_page():
 
 
 # --- Main App Logic ---
-st.set_page_config(layout="wide", page_title="Conteúdo IA")
-
 # Initialize session state variables if they don't exist
-default_session_state = {
-    "current_page": "dashboard",
-    "is_loading": False,
-    "generated_result": "",
-    "error_message": "",
-    "user_id": None, # Will be set by get_user_id()
-    "user_display_name": "Usuário",
-    "generated_content_list": [],
-    "last_doc_snapshot": None,
-    "has_more_content": True,
-    "is_loading_content": True, # Start loading content on first run of "My Content"
-    "deleting_item_id": None,
-    "editing_item_id": None,
-
-}
-for key, value in default_session_state.items():
-    if key not in st.session_state:
-        st.session_state[key] = value
+for key, value in _DEFAULT_SESSION_STATE.items():
+    st.session_state.setdefault(key, copy.copy(value)) # Copy so sessions never share a mutable default
 
 # Ensure user ID is set
 get_user_id()
@@ -510,55 +757,20 @@ with st.sidebar:
     st.caption(f"ID: {st.session_state.user_id[:10]}...") # Show first 10 chars of ID
     st.divider()
 
-    # Using streamlit_option_menu for a nicer look
-    # Icons from: https://icons.getbootstrap.com/ (use names) or emojis
-    app_mode = option_menu(
-        menu_title=None, # "Menu Principal",
-        options=["Dashboard", "Ferramentas", "Meus Conteúdos"],
-        icons=["speedometer2", "tools", "archive-fill"], # Bootstrap icons
-        menu_icon="cast", default_index=0,
-        # orientation="horizontal", # If you want horizontal menu
-        styles={
-            "container": {"padding": "5!important", "background-color": "#fafafa"},
-            # "icon": {"color": "orange", "font-size": "25px"}, 
-            # "nav-link": {"font-size": "16px", "text-align": "left", "margin":"0px", "--hover-color": "#eee"},
-            # "nav-link-selected": {"background-color": "#02ab21"},
-        }
-    )
-
-    if app_mode == "Dashboard":
-        st.session_state.current_page = "dashboard"
-    elif app_mode == "Meus Conteúdos":
-        st.session_state.current_page = "my-content"
-    elif app_mode == "Ferramentas":
-        # Sub-menu for tools
-        selected_tool_name = option_menu(
-            menu_title="Escolha uma Ferramenta",
-            options=[config['name'] for config in tool_configs.values()],
-            icons=[config['icon'] for config in tool_configs.values()], # Using emojis as icons here
-            menu_icon="chevron-down", # Optional: an icon for the submenu itself
-            default_index=0
-        )
-        # Find the tool_key based on the selected_tool_name
-        for tool_key_iter, config_iter in tool_configs.items():
-            if config_iter['name'] == selected_tool_name:
-                st.session_state.current_page = f"tool/{tool_key_iter}"
-                break
-    
     # st.info("Este é um app de demonstração adaptado de um projeto React.")
 
 
 # Page Routing
-page_parts = st.session_state.current_page.split('/')
-page_type = page_parts[0]
-page_arg = page_parts[1] if len(page_parts) > 1 else None
-
-if page_type == "dashboard":
-    render_dashboard_page()
-elif page_type == "tool" and page_arg:
-    render_tool_page(page_arg)
-elif page_type == "my-content":
-    render_my_content_page()
-else:
-    render_dashboard_page() # Default to dashboard
-
+# Native multipage navigation; st.navigation renders the menu in the sidebar
+tool_pages = {
+    tool_key: st.Page(partial(render_tool_page, tool_key), title=config['name'], icon=config['icon'], url_path=f"tool-{tool_key}")
+    for tool_key, config in tool_configs.items()
+}
+page = st.navigation({
+    "": [
+        st.Page(render_dashboard_page, title="Dashboard", icon="📊", default=True),
+        st.Page(render_my_content_page, title="Meus Conteúdos", icon="💾", url_path="my-content"),
+    ],
+    "Ferramentas": list(tool_pages.values()),
+})
+page.run()